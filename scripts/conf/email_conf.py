@@ -18,3 +18,16 @@ class OwnersCollectionsConfig:
     ExcludeRepo = "owners_collections"
     User = "****"
     TargetFileName = "OWNERS"
+    SyncWorkers = 8  # 并发同步的代码仓数
+    GiteeAPI = "https://gitee.com/api/v5"
+    SyncBackend = "git"  # git: 克隆代码仓收集; api: 通过gitee文件树接口收集, 无需克隆
+    BlobCacheDir = "data/blobs"  # api模式下按sha缓存的文件内容
+    CloneMode = "sparse"  # full: 完整克隆; sparse: 部分克隆, 只检出TargetFileName
+    PageSize = 100  # 获取代码仓列表时每页数量, gitee最大支持100
+    WebhookPort = 0  # webhook监听端口, 0表示不启用
+    WebhookSecret = ""  # webhook密码, 与gitee中配置的一致
+    WebhookEvents = ["Push Hook", "Repo Hook"]  # 触发同步的事件
+    WebhookRepoEvents = ["Repo Hook"]  # 代码仓事件, 只处理创建代码仓
+    WebhookDebounce = 60  # 最后一个事件之后等待的时间(秒)
+    WebhookMaxWait = 600  # 第一个事件之后最长等待的时间(秒)
+    WebhookTrigger = 72  # 启用webhook后全量同步的间隔(小时)
@@ -37,11 +37,28 @@ check_name_map = {
 }
 
 OBSName = "mindstudio-pr-log"
+OBSAddr = "obs.cn-north-4.myhuaweicloud.com"  # obs地址
 GiteeAddr = "https://gitee.com/api/v5/repos"  # Gitee 接口地址
 
 # 北京四区
+HWRegion = "cn-north-4"  # 华为云区域
 CodeBuildAddr = "https://cloudbuild-ext.cn-north-4.myhuaweicloud.com"  # 编译地址
 CodeartsAPI = "https://cloudpipeline-ext.cn-north-4.myhuaweicloud.com/v5"  # codearts接口前缀
 CodeArtsDomain = "https://devcloud.cn-north-4.huaweicloud.com"  # codearts域名
 HWLoginAPI = "https://iam.cn-north-4.myhuaweicloud.com/v3/auth/tokens"  # 华为云登录地址
 MajunURL = "https://majun.osinfra.cn"  # Majun域名
+
+# *********************************  监控配置  **********************************
+
+LogRoot = "/usr1/log"  # 日志本地存放目录
+LogWorkers = 4  # 并发下载/上传日志的最大任务数
+PollMinInterval = 15  # 流水线状态最小轮询间隔(秒)
+PollMaxInterval = 120  # 流水线状态最大轮询间隔(秒)
+HistoryMaxPages = 10  # 查询codebuild构建记录的最大页数
+HistoryBatchPages = 3  # 每批并发查询的构建记录页数
+TokenCacheFile = "/usr1/cache/codearts_token.json"  # codearts token本地缓存文件
+TokenExpireMargin = 600  # token提前失效时间(秒)
+DurationCacheFile = "/usr1/cache/job_durations.json"  # 任务历史耗时本地缓存文件, 用于预估任务结束时间
+DaemonQueueDir = "/usr1/monitor/queue"  # 监控守护进程请求队列目录
+DaemonWorkers = 8  # 守护进程同时执行轮询的最大pr数
+DaemonMaxErrors = 3  # 单个pr连续轮询失败的最大次数
@@ -2,16 +2,27 @@
 
 import os
 import re
+import sys
+import uuid
 import json
 import time
+import codecs
+import hashlib
 import logging
-import requests
 import argparse
-import subprocess
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 
 from config import table_header, table_body, GiteeAddr, check_name_map, OBSName, CodeartsAPI, CodeArtsDomain, \
-    HWLoginAPI, CodeBuildAddr, MajunURL
-from tools.utils import retry_decorator
+    HWLoginAPI, CodeBuildAddr, MajunURL, LogWorkers, PollMinInterval, PollMaxInterval, HistoryMaxPages, \
+    HistoryBatchPages, HWRegion, TokenCacheFile, TokenExpireMargin, OBSAddr, LogRoot, DaemonQueueDir, DaemonWorkers, \
+    DaemonMaxErrors, DurationCacheFile
+from tools.utils import retry_decorator, dump_json, load_json
+from tools.http_client import http_client
+from tools.poll_scheduler import PollScheduler
+from tools.token_cache import TokenCache
+from tools.obs_uploader import ObsUploader
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
 
@@ -25,6 +36,151 @@ Status_Dict = {
     "FAILED": dict(code="10060", detail="FAILED"),
 }
 
+LogChunkSize = 1024 * 1024  # 日志流式下载的分块大小
+
+
+class MajunScanner:
+    MaxLineLength = 64 * 1024  # 未换行内容的最大缓存长度
+
+    def __init__(self):
+        """
+        在日志流中逐行匹配majun的任务链接
+        """
+        self.url = ''
+        self.pending = ''
+
+    def scan(self, line: str):
+        if MajunURL in line and f'{MajunURL}/api' not in line:
+            urls = re.findall(URL_Pattern, line)
+            if urls:
+                self.url = urls[0]
+
+    def feed(self, text: str):
+        """
+        输入一段日志, 不完整的行留到下一次匹配
+        :param text: 日志片段
+        """
+        if self.url:
+            return
+        lines = (self.pending + text).split('\n')
+        self.pending = lines.pop()[-self.MaxLineLength:]
+        for line in lines:
+            self.scan(line)
+            if self.url:
+                return
+
+    def close(self) -> str:
+        """
+        匹配剩余内容并返回链接
+        :return:
+        """
+        if not self.url:
+            self.scan(self.pending)
+        self.pending = ''
+        return self.url
+
+
+class BuildHistoryIndex:
+    PageSize = 100  # 每页构建记录数
+
+    def __init__(self,
+                 get=http_client.get,
+                 max_pages: int = HistoryMaxPages,
+                 batch_pages: int = HistoryBatchPages
+                 ):
+        """
+        codebuild构建记录索引, 缓存 record_id -> build_number -> build_record_id 的映射
+        :param get: 发送GET请求的方法
+        :param max_pages: 最多查询的构建记录页数
+        :param batch_pages: 每批并发查询的页数
+        """
+        self.get = get
+        self.max_pages = max_pages
+        self.batch_pages = max(1, batch_pages)
+        self.build_numbers = {}  # job_id -> {record_id: build_number}
+        self.record_ids = {}  # (job_id, build_number) -> build_record_id
+        self.lock = threading.Lock()
+
+    def lookup(self, job_id, daily_build_number):
+        with self.lock:
+            return self.build_numbers.get(job_id, {}).get(daily_build_number)
+
+    def fetch_page(self, headers, job_id, page: int):
+        """
+        查询一页构建记录并写入索引
+        :param headers: codearts 请求头
+        :param job_id: 任务id
+        :param page: 页码
+        :return: 本页构建记录, 请求失败时返回None
+        """
+        url = f'{CodeBuildAddr}/v3/jobs/{job_id}/history'
+        response = self.get(url,
+                            params=dict(limit=self.PageSize, interval=5, offset=page),
+                            headers=headers)
+        if response.status_code != 200:
+            logging.error(f'请求失败,状态码: {response.status_code},相应阶段: get_build_number')
+            return None
+
+        records = response.json()['history_records']
+        with self.lock:
+            index = self.build_numbers.setdefault(job_id, {})
+            for entry in records:
+                index[entry['record_id']] = entry['build_number']
+        return records
+
+    def get_build_number(self, headers, job_id, daily_build_number):
+        """
+        根据daily_build_number获取build_number, 未命中缓存时分批并发查询构建记录
+        :param headers: codearts 请求头
+        :param job_id: 任务id
+        :param daily_build_number:
+        :return:
+        """
+        if daily_build_number is None:
+            return None
+
+        number = self.lookup(job_id, daily_build_number)
+        if number is not None:
+            return number
+
+        for start in range(0, self.max_pages, self.batch_pages):
+            pages = range(start, min(start + self.batch_pages, self.max_pages))
+            with ThreadPoolExecutor(max_workers=len(pages)) as executor:
+                results = list(executor.map(lambda page: self.fetch_page(headers, job_id, page), pages))
+
+            number = self.lookup(job_id, daily_build_number)
+            if number is not None:
+                logging.info(f"build_number: {number}")
+                return number
+
+            # 已查到最后一页
+            if any(records is not None and len(records) < self.PageSize for records in results):
+                break
+        logging.error(f'未找到构建记录: {daily_build_number},相应阶段: get_build_number')
+
+    def get_build_record_id(self, headers, job_id, build_number):
+        """
+        根据build_number获取build_record_id
+        :param headers: codearts 请求头
+        :param job_id: 任务id
+        :param build_number:
+        :return:
+        """
+        key = (job_id, build_number)
+        with self.lock:
+            if key in self.record_ids:
+                return self.record_ids[key]
+
+        url = f'{CodeBuildAddr}/v4/jobs/{job_id}/{build_number}/record-info'
+        response = self.get(url, headers=headers)
+        if response.status_code == 200:
+            build_record_id = response.json()['result']['build_record_id']
+            logging.info(f"build_record_id: {build_record_id}")
+            with self.lock:
+                self.record_ids[key] = build_record_id
+            return build_record_id
+        logging.error(f'请求失败,状态码: {response.status_code},相应阶段: get_build_record_id')
+
 
 class GiteeApp:
 
@@ -59,7 +215,7 @@ class GiteeApp:
         prefix = f'{self.root_url}/pulls/{self.pr_id}/labels'
         url = f'{prefix}?access_token={self.token}&page={page}&per_page={per_page}'
 
-        resp = requests.get(url)
+        resp = http_client.get(url)
         if resp.status_code not in [200, 201, 204]:
             raise ConnectionError("get labels fail...")
         return resp.json()
@@ -72,7 +228,7 @@ class GiteeApp:
         :return:
         """
         prefix = f'{self.root_url}/pulls/{self.pr_id}/labels'
-        resp = requests.delete(url=f'{prefix}/{label}?access_token={self.token}')
+        resp = http_client.delete(url=f'{prefix}/{label}?access_token={self.token}')
         if resp.status_code not in [200, 201, 204]:
             raise ConnectionError("get labels fail...")
 
@@ -81,14 +237,35 @@ class GiteeApp:
         """
         增加评论
         :param msg: 评论内容
+        :return: 评论id
         """
         logging.info(f"comment url: {self.remark_url}")
-        response = requests.post(self.remark_url,
-                                 data=dict(access_token=self.token, body=msg))
+        response = http_client.post(self.remark_url,
+                                    data=dict(access_token=self.token, body=msg))
         if response.status_code not in [200, 201, 204]:
             raise ConnectionError("comment fail...")
 
         logging.info(f'comment success')
+        return response.json().get("id")
+
+    @retry_decorator
+    def update_comment(self, comment_id: str, msg: str) -> bool:
+        """
+        编辑评论
+        :param comment_id: 评论id
+        :param msg: 评论内容
+        :return: 评论不存在时返回False
+        """
+        url = f'{self.root_url}/pulls/comments/{comment_id}'
+        response = http_client.patch(url, data=dict(access_token=self.token, body=msg))
+        if response.status_code == 404:
+            logging.info(f'comment {comment_id} not found')
+            return False
+        if response.status_code not in [200, 201, 204]:
+            raise ConnectionError("update comment fail...")
+
+        logging.info(f'update comment {comment_id} success')
+        return True
 
     @retry_decorator
     def get_comments(self, page: int = 1, per_page: int = 100, desc: bool = True):
@@ -101,7 +278,7 @@ class GiteeApp:
         """
         desc = "desc" if desc else ""
         params = dict(access_token=self.token, page=page, per_page=per_page, direction=desc)
-        resp = requests.get(self.remark_url, params=params)
+        resp = http_client.get(self.remark_url, params=params)
 
         if resp.status_code == 200:
             return resp.json()
@@ -114,8 +291,8 @@ class GiteeApp:
         :param comment_id:
         :return:
         """
-        del_url = f'{self.remark_url}/{comment_id}?access_token={args.access_token}'
-        resp = requests.delete(url=del_url)
+        del_url = f'{self.remark_url}/{comment_id}?access_token={self.token}'
+        resp = http_client.delete(url=del_url)
         if resp.status_code != 200:
             logging.error(f'delete comment failure, comment id: {comment_id}')
             raise ConnectionError("del comment fail...")
@@ -137,7 +314,11 @@ class ChecklistApp:
                  obs_dict: str,
                  ak: str,
                  sk: str,
-                 remove_detail: str
+                 remove_detail: str,
+                 max_workers: int = LogWorkers,
+                 poll_min_interval: float = PollMinInterval,
+                 poll_max_interval: float = PollMaxInterval,
+                 durations: dict = None
                  ):
         """
         @token: github token
@@ -154,6 +335,10 @@ class ChecklistApp:
         @ak: codearts ak
         @sk: codearts sk
         @remove_detail: 是否删除详情列
+        @max_workers: 并发处理日志的最大任务数
+        @poll_min_interval: 最小轮询间隔(秒)
+        @poll_max_interval: 最大轮询间隔(秒)
+        @durations: 任务历史耗时, 多个pr间共享
         """
         self.token = token
         self.owner = owner
@@ -169,6 +354,20 @@ class ChecklistApp:
         self.ak = ak
         self.sk = sk
         self.remove_detail = remove_detail
+        self.max_workers = max(1, int(max_workers))
+        self.log_uploader = ObsUploader(ak, sk, OBSAddr, OBSName, LogRoot, prefix="PR", excludes=("codecheck*",))
+        self.job_states = {}  # step_run_id -> 已处理的任务状态
+        self.job_logs = {}  # step_run_id -> 日志链接
+        self.plug_in_states = {}  # step_run_id -> 分布式用例检查结果
+        self.scheduler = PollScheduler(poll_min_interval, poll_max_interval, durations=durations,
+                                       durations_path=DurationCacheFile)
+        self.headers = None
+        self.status = ""
+        self.status_comment_id = None
+        self.status_comment_hash = ""
+        self.history_index = BuildHistoryIndex(get=self.codearts_get)
+        self.token_cache = TokenCache(TokenCacheFile, margin=TokenExpireMargin)
+        self.token_lock = threading.Lock()
         self.last_project_id = ""
         self.last_pipeline_id = ""
         self.last_pipeline_run_id = ""
@@ -179,9 +378,9 @@ class ChecklistApp:
 
     def get_daily_build_number(self, headers, step_run_id):
         url = f"{self.last_pl_api_pref}/{self.last_pipeline_run_id}/steps/outputs"
-        response = requests.get(url,
-                                params={"step_run_ids": step_run_id},
-                                headers=headers)
+        response = self.codearts_get(url,
+                                     params={"step_run_ids": step_run_id},
+                                     headers=headers)
 
         if response.status_code == 200:
             for entry in response.json()['step_outputs'][0]['output_result']:
@@ -192,51 +391,57 @@ class ChecklistApp:
         else:
             logging.error(f'请求失败,状态码: {response.status_code},相应阶段: get_daily_build_number')
 
-    @staticmethod
-    def get_build_number(headers, job_id, daily_build_number):
-        url = f'{CodeBuildAddr}/v3/jobs/{job_id}/history'
-        k = 200
-        for i in range(0, 3):
-            response = requests.get(url,
-                                    params=dict(limit=100, interval=5, offset=i),
-                                    headers=headers)
-
-            if response.status_code == 200:
-                for entry in response.json()['history_records']:
-                    if entry['record_id'] == daily_build_number:
-                        logging.info(f"build_number: {entry['build_number']}")
-                        return entry['build_number']
-
-            k = response.status_code
-        logging.error(f'请求失败,状态码: {k},相应阶段: get_build_number')
-
-    @staticmethod
-    def get_build_record_id(headers, job_id, build_number):
-        url = f'{CodeBuildAddr}/v4/jobs/{job_id}/{build_number}/record-info'
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            build_record_id = response.json()['result']['build_record_id']
-            logging.info(f"build_record_id: {build_record_id}")
-            return build_record_id
-        logging.error(f'请求失败,状态码: {response.status_code},相应阶段: get_build_record_id')
-
-    def get_codearts_token(self) -> dict:
+    def get_codearts_token(self, stale_token: str = None) -> dict:
         """
-        获取codearts token
+        获取codearts token, 优先使用本地缓存
+        :param stale_token: 已失效的token, 缓存中的token与其相同时重新登录
         :return:
         """
+        key = TokenCache.make_key(self.username, self.subUsername, HWRegion)
+        token = self.token_cache.get(key)
+        if token and token != stale_token:
+            logging.info("使用缓存的codearts token...")
+            return {"x-auth-token": token}
+
         logging.info("获取codearts token...")
         user = dict(password=self.password, domain=dict(name=self.username), name=self.subUsername)
         header = {
             "auth": {
                 "identity": {"password": {"user": user}, "methods": ["password"]},
-                "scope": {"project": {"name": "cn-north-4"}}
+                "scope": {"project": {"name": HWRegion}}
             }
         }
-        resp = requests.post(url=HWLoginAPI, data=json.dumps(header))
+        resp = http_client.post(url=HWLoginAPI, data=json.dumps(header))
         token = resp.headers["X-Subject-Token"]
+
+        try:
+            expires_at = datetime.strptime(resp.json()["token"]["expires_at"], "%Y-%m-%dT%H:%M:%S.%fZ")
+            self.token_cache.set(key, token, expires_at.replace(tzinfo=timezone.utc).timestamp())
+        except (KeyError, ValueError, OSError) as e:
+            logging.error(f"缓存codearts token失败: {e}")
         return {"x-auth-token": token}
 
+    def codearts_get(self, url: str, headers: dict, **kwargs):
+        """
+        请求codearts接口, token失效时刷新headers中的token后重试
+        :param url: 请求地址
+        :param headers: codearts 请求头
+        :param kwargs:
+        :return:
+        """
+        used_token = headers.get("x-auth-token")
+        response = http_client.get(url, headers=headers, **kwargs)
+        if response.status_code != 401:
+            return response
+
+        response.close()
+        with self.token_lock:
+            # 其他线程已刷新时直接重试
+            if headers.get("x-auth-token") == used_token:
+                logging.info("codearts token已失效, 重新获取...")
+                headers.update(self.get_codearts_token(stale_token=used_token))
+        return http_client.get(url, headers=headers, **kwargs)
+
     @staticmethod
     def convert_check_name_map():
         """
@@ -248,52 +453,50 @@ class ChecklistApp:
                 res[i] = k
         return res
 
-    def download_failed_log(self, headers, job_id, job_name, step_run_id):
+    def download_failed_log(self, headers, job_id, job_name, step_run_id) -> str:
         """
-        下载失败的日志至本地
+        流式下载日志至本地, 同时匹配majun的任务链接, 查询或下载失败时抛出异常, 以便下次轮询重试
         :param headers: codearts 请求头
         :param job_id: 任务id
         :param job_name: 任务名称
         :param step_run_id:
-        :return:
+        :return: majun任务链接
         """
         daily_build_num = self.get_daily_build_number(headers, step_run_id)
-        build_num = self.get_build_number(headers, job_id, daily_build_num)
-        record_id = self.get_build_record_id(headers, job_id, build_num)
+        if daily_build_num is None:
+            raise Exception(f"get daily build number of {job_name} failed")
+        build_num = self.history_index.get_build_number(headers, job_id, daily_build_num)
+        if build_num is None:
+            raise Exception(f"get build number of {job_name} failed")
+        record_id = self.history_index.get_build_record_id(headers, job_id, build_num)
+        if record_id is None:
+            raise Exception(f"get build record id of {job_name} failed")
 
         url = f'{CodeBuildAddr}/v4/{record_id}/download-log'
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            dir_path = f'/usr1/log/{self.repo}/{self.pr_id}/'
-            os.makedirs(dir_path, exist_ok=True)
-            with open(dir_path + f'{self.pr_id}_{job_name}.txt', 'a+', encoding='UTF-8') as f:
-                f.write(response.text)
-        else:
-            logging.error(f'请求失败,状态码: {response.status_code},相应阶段: download_log')
-
-    def upload_failed_log(self):
-        subprocess.call(
-            f"""
-            cd /usr1/log
-            rm -rf {self.repo}/{self.pr_id}/codecheck*
-            obsutil config -i={self.ak} -k={self.sk} -e=obs.cn-north-4.myhuaweicloud.com
-            obsutil cp {self.repo} obs://{OBSName}/PR/ -r -f""",
-            shell=True
-        )
+        scanner = MajunScanner()
+        with self.codearts_get(url, headers=headers, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f'请求失败,状态码: {response.status_code},相应阶段: download_log')
 
-    def find_majun_url(self, name: str) -> str:
+            dir_path = f'{LogRoot}/{self.repo}/{self.pr_id}/'
+            os.makedirs(dir_path, exist_ok=True)
+            decoder = codecs.getincrementaldecoder(response.encoding or 'UTF-8')(errors='replace')
+            with open(dir_path + f'{self.pr_id}_{job_name}.txt', 'w', encoding='UTF-8') as f:
+                for chunk in response.iter_content(chunk_size=LogChunkSize):
+                    text = decoder.decode(chunk)
+                    f.write(text)
+                    scanner.feed(text)
+                text = decoder.decode(b'', final=True)
+                f.write(text)
+                scanner.feed(text)
+        return scanner.close()
+
+    def upload_failed_log(self) -> int:
         """
-        从日志中匹配majun的任务链接
-        :param name: 任务名称
-        :return:
+        将本pr新增或变化的日志合并为一次上传
+        :return: 上传的文件数
         """
-        with open(f'/usr1/log/{self.repo}/{self.pr_id}/{self.pr_id}_{name}.txt', 'r', encoding='UTF-8') as f:
-            for line in f.readlines():
-                if MajunURL in line and f'{MajunURL}/api' not in line:
-                    urls = re.findall(URL_Pattern, line)
-                    if urls:
-                        return urls[0]
-        return ''
+        return self.log_uploader.upload(f"{self.repo}/{self.pr_id}")
 
     @staticmethod
     def generate_table(items: list, remove_detail: str):
@@ -330,17 +533,28 @@ class ChecklistApp:
         html = html + "</table>"
         return html
 
+    def find_stage_comment(self):
+        """
+        查找已有的状态评论
+        :return: 评论id
+        """
+        for comments in self.gitee_app.get_comments() or []:
+            if '状态' in comments["body"]:
+                return comments["id"]
+
     def update_stage_comment(self, comment_table: str):
-        """更新评论"""
-        comment_data = self.gitee_app.get_comments()
-        if not comment_data:
+        """更新评论, 内容未变化时跳过, 已有状态评论时原地编辑"""
+        table_hash = hashlib.md5(comment_table.encode("utf-8")).hexdigest()
+        if table_hash == self.status_comment_hash:
+            logging.info("状态表未变化, 跳过评论更新")
             return
-        for comments in comment_data:
-            comment, cid = comments["body"], comments["id"]
-            if '状态' in comment:
-                self.gitee_app.del_comment(cid)
-                break
-        self.gitee_app.add_comment(comment_table)
+
+        if self.status_comment_id is None:
+            self.status_comment_id = self.find_stage_comment()
+
+        if not self.status_comment_id or not self.gitee_app.update_comment(self.status_comment_id, comment_table):
+            self.status_comment_id = self.gitee_app.add_comment(comment_table)
+        self.status_comment_hash = table_hash
 
     def get_plug_in_state(self, headers, step_run_id):
         """
@@ -349,9 +563,9 @@ class ChecklistApp:
         :return:
         """
         url = f'{self.last_pl_api_pref}/{self.last_pipeline_run_id}/steps/outputs'
-        response = requests.get(url,
-                                params=dict(step_run_ids=step_run_id),
-                                headers=headers)
+        response = self.codearts_get(url,
+                                     params=dict(step_run_ids=step_run_id),
+                                     headers=headers)
 
         res = {
             "check_name": "dist_test_or_not",
@@ -425,7 +639,61 @@ class ChecklistApp:
                     self.gitee_app.del_comment(cid)
                 is_recent = False
 
-    def run(self):
+    def harvest_job(self, headers, job: dict, standard_name: str) -> str:
+        """
+        下载已结束任务的日志, 返回日志链接
+        :param headers: codearts 请求头
+        :param job: 流水线任务详情
+        :param standard_name: 检查项标准命名
+        :return:
+        """
+        name, step_run_id = job["name"], job["steps"][0]["id"]
+        obs_log_url = f"https://{self.obs_dic}/{self.repo}/{self.pr_id}/{self.pr_id}_{name}.txt"
+
+        majun_url = ''
+        if name != "dist_test_or_not":
+            for entry in job["steps"][0]["inputs"]:
+                if entry["key"] == "jobId":
+                    majun_url = self.download_failed_log(headers=headers,
+                                                         job_id=entry['value'],
+                                                         job_name=name,
+                                                         step_run_id=step_run_id
+                                                         )
+        if standard_name in ["sca", "anti_poison", "code_check"]:
+            obs_log_url = majun_url
+        return obs_log_url
+
+    def harvest_logs(self, headers, jobs: list, job_name_map: dict) -> dict:
+        """
+        并发处理已结束任务的日志
+        :param headers: codearts 请求头
+        :param jobs: 已结束的流水线任务
+        :param job_name_map: 检查项映射表
+        :return: step_run_id与日志链接的映射
+        """
+        if not jobs:
+            return {}
+
+        res = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor:
+            futures = {}
+            for job in jobs:
+                standard_name = job_name_map.get(job["name"], job["name"])
+                futures[job["steps"][0]["id"]] = (job["name"],
+                                                  executor.submit(self.harvest_job, headers, job, standard_name))
+
+            for step_run_id, (name, future) in futures.items():
+                try:
+                    res[step_run_id] = future.result()
+                except Exception as e:
+                    logging.error(f"处理任务 {name} 日志失败: {e}")
+        return res
+
+    def prepare(self):
+        """
+        轮询前的准备工作, 返回codearts请求头
+        :return:
+        """
         # 1. 获取codearts接口访问token
         headers = self.get_codearts_token()
 
@@ -447,105 +715,326 @@ class ChecklistApp:
         if pl:
             self.last_project_id, self.last_pipeline_id, self.last_pipeline_run_id, self.commit_id = pl
 
-        # 6. 解析流水线1结果
-        job_name_map = self.convert_check_name_map()
         self.last_pl_api_pref = f"{CodeartsAPI}/{self.last_project_id}/api/pipelines/{self.last_pipeline_id}/pipeline-runs"
+        return headers
+
+    def poll(self, headers) -> dict:
+        """
+        查询一次流水线一的结果并更新评论
+        :param headers: codearts 请求头
+        :return: 流水线详情
+        """
+        job_name_map = self.convert_check_name_map()
+        check_res = []
+        pipeline_detail = f'{self.last_pl_api_pref}/detail?pipeline_run_id={self.last_pipeline_run_id}'
+        resp = self.codearts_get(pipeline_detail, headers=headers)
+        resp_text = json.loads(resp.text)
+        logging.info(f"流水线一运行状态为: {resp_text['status']}")
+
+        jobs = [job for stage in resp_text["stages"] for job in stage["jobs"]
+                if job["name"] not in "monitor_trigger"]
+
+        # 仅处理状态发生变化的已结束任务, 并发执行, 结果按阶段顺序合并
+        changed = [job for job in jobs if job["status"] in ["FAILED", "COMPLETED"]
+                   and self.job_states.get(job["steps"][0]["id"]) != job["status"]]
+        log_urls = self.harvest_logs(headers, changed, job_name_map)
+        self.job_logs.update(log_urls)
+        changed_ids = {job["steps"][0]["id"] for job in changed}
+        for job in jobs:
+            step_run_id = job["steps"][0]["id"]
+            if step_run_id not in changed_ids or step_run_id in log_urls:
+                self.job_states[step_run_id] = job["status"]
+        self.upload_failed_log()
+
+        for job in jobs:
+            name, status = job["name"], job["status"]
+            log_link, pack_link = NA, NA
+            standard_name = job_name_map.get(name, name)
+            step_run_id = job["steps"][0]["id"]
+            obs_log_url = self.job_logs.get(step_run_id,
+                                            f"https://{self.obs_dic}/{self.repo}/{self.pr_id}/{self.pr_id}_{name}.txt")
+
+            logging.info(f"job name: {standard_name}, obs_log_url: {obs_log_url}, status: {status}")
+
+            log_link = f'<a href="{obs_log_url}">>>></a>'
+
+            if self.repo == "pytorch" and status == "COMPLETED":
+                if 'dist_test_or_not' in name.lower():
+                    if step_run_id not in self.plug_in_states:
+                        self.plug_in_states[step_run_id] = self.get_plug_in_state(headers, step_run_id)
+                    check_res.append(self.plug_in_states[step_run_id])
+                if 'build' in standard_name:
+                    pack_link = self.get_package_link(name)
+
+            info = Status_Dict.get(status)
+            if info and name != "dist_test_or_not":
+                check_res.append(dict(check_name=standard_name.lower(),
+                                      status=info.get("code"),
+                                      detail=info.get("detail"),
+                                      log=log_link,
+                                      package=pack_link))
+
+        comment_table = self.generate_table(check_res, self.remove_detail)
+        self.update_stage_comment(comment_table)
+        return resp_text
+
+    def step(self):
+        """
+        执行一次轮询, 首次调用时先完成准备工作
+        :return: 下一次轮询间隔(秒), 流水线已结束时返回None
+        """
+        if self.headers is None:
+            self.headers = self.prepare()
+
+        # 6. 解析流水线1结果, 根据任务状态调整轮询间隔
+        start = time.time()
+        resp_text = self.poll(self.headers)
+        self.status = resp_text["status"]
+        jobs = {f'{self.repo}/{job["name"]}': job["status"] for stage in resp_text["stages"] for job in stage["jobs"]}
+        return self.scheduler.next_interval(self.status, jobs, time.time() - start)
+
+    def run(self):
         while True:
-            check_res = []
-            pipeline_detail = f'{self.last_pl_api_pref}/detail?pipeline_run_id={self.last_pipeline_run_id}'
-            resp = requests.get(pipeline_detail, headers=headers)
-            resp_text = json.loads(resp.text)
-            logging.info(f"流水线一运行状态为: {resp_text['status']}")
-
-            for stage in resp_text["stages"]:
-                for job in stage["jobs"]:
-                    name, status = job["name"], job["status"]
-                    log_link, pack_link = NA, NA
-                    standard_name = job_name_map.get(name, name)
-                    obs_log_url = f"https://{self.obs_dic}/{self.repo}/{self.pr_id}/{self.pr_id}_{name}.txt"
-                    step_run_id = job["steps"][0]["id"]
-
-                    if name in "monitor_trigger":
-                        continue
-
-                    if status in ["FAILED", "COMPLETED"]:
-                        if name != "dist_test_or_not":
-                            for entry in job["steps"][0]["inputs"]:
-                                if entry["key"] == "jobId":
-                                    job_id = entry['value']
-                                    self.download_failed_log(headers=headers,
-                                                             job_id=job_id,
-                                                             job_name=name,
-                                                             step_run_id=step_run_id
-                                                             )
-                                    self.upload_failed_log()
-                        if standard_name in ["sca", "anti_poison", "code_check"]:
-                            obs_log_url = self.find_majun_url(name)
-
-                    logging.info(f"job name: {standard_name}, obs_log_url: {obs_log_url}, status: {status}")
-
-                    log_link = f'<a href="{obs_log_url}">>>></a>'
-
-                    if self.repo == "pytorch" and status == "COMPLETED":
-                        if 'dist_test_or_not' in name.lower():
-                            tmp_dict = self.get_plug_in_state(headers, step_run_id)
-                            check_res.append(tmp_dict)
-                        if 'build' in standard_name:
-                            pack_link = self.get_package_link(name)
-
-                    info = Status_Dict.get(status)
-                    if info and name != "dist_test_or_not":
-                        check_res.append(dict(check_name=standard_name.lower(),
-                                              status=info.get("code"),
-                                              detail=info.get("detail"),
-                                              log=log_link,
-                                              package=pack_link))
-
-            comment_table = self.generate_table(check_res, self.remove_detail)
-            self.update_stage_comment(comment_table)
-
-            if resp_text["status"] != "RUNNING":
+            interval = self.step()
+            if interval is None:
                 break
+            time.sleep(interval)
+        self.scheduler.summary()
 
-            time.sleep(60)
+
+class MonitorDaemon:
+
+    def __init__(self,
+                 queue_dir: str = DaemonQueueDir,
+                 max_workers: int = DaemonWorkers
+                 ):
+        """
+        多pr监控守护进程, 从队列目录接收监控请求, 在同一事件循环中调度所有pr的轮询,
+        各pr共享token缓存、连接池和任务耗时统计
+        :param queue_dir: 请求队列目录
+        :param max_workers: 同时执行轮询的最大pr数
+        """
+        self.queue_dir = queue_dir
+        self.running_dir = os.path.join(queue_dir, "running")
+        self.done_dir = os.path.join(queue_dir, "done")
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.durations = {}
+        self.watchers = {}  # 请求id -> 监控状态
+
+    @staticmethod
+    def is_alive(queue_dir: str) -> bool:
+        """
+        守护进程是否在运行
+        :param queue_dir: 请求队列目录
+        :return:
+        """
+        try:
+            with open(os.path.join(queue_dir, "daemon.pid"), 'r') as f:
+                os.kill(int(f.read().strip()), 0)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    @staticmethod
+    def submit(queue_dir: str, request: dict) -> str:
+        """
+        提交监控请求
+        :param queue_dir: 请求队列目录
+        :param request: ChecklistApp 参数
+        :return: 请求id
+        """
+        req_id = f"{request['owner']}_{request['repo']}_{request['pr_id']}_{uuid.uuid4().hex[:8]}"
+        os.makedirs(queue_dir, mode=0o700, exist_ok=True)
+        dump_json(os.path.join(queue_dir, f"{req_id}.json"), request, mode=0o600)
+        return req_id
+
+    @staticmethod
+    def wait(queue_dir: str, req_id: str, interval: float = 5):
+        """
+        等待监控请求结束, 守护进程退出时收回请求
+        :param queue_dir: 请求队列目录
+        :param req_id: 请求id
+        :param interval: 检查间隔(秒)
+        :return: 监控结果, 请求已收回需要在本进程监控时返回None
+        """
+        path = os.path.join(queue_dir, "done", f"{req_id}.json")
+        while not os.path.exists(path):
+            if not MonitorDaemon.is_alive(queue_dir):
+                for req_path in (os.path.join(queue_dir, f"{req_id}.json"),
+                                 os.path.join(queue_dir, "running", f"{req_id}.json")):
+                    try:
+                        os.remove(req_path)
+                        logging.error(f"监控守护进程已退出, 收回请求 {req_id}")
+                        return None
+                    except FileNotFoundError:
+                        pass
+                if not os.path.exists(path):
+                    return dict(status="ERROR", message="监控守护进程已退出")
+                break
+            time.sleep(interval)
+        res = load_json(path)
+        os.remove(path)
+        return res
+
+    def accept(self):
+        """
+        接收队列目录中的新请求, 同一pr的旧请求会被替代
+        """
+        for filename in sorted(os.listdir(self.queue_dir)):
+            if not filename.endswith(".json"):
+                continue
+            req_id, path = filename[:-5], os.path.join(self.running_dir, filename)
+            os.replace(os.path.join(self.queue_dir, filename), path)
+
+            try:
+                app = ChecklistApp(**load_json(path), durations=self.durations)
+            except (TypeError, ValueError) as e:
+                logging.error(f"无效的监控请求 {req_id}: {e}")
+                self.finish(req_id, "ERROR", str(e))
+                continue
+
+            key = (app.owner, app.repo, app.pr_id)
+            for other_id, watcher in list(self.watchers.items()):
+                if watcher["key"] == key:
+                    logging.info(f"监控请求 {other_id} 被 {req_id} 替代")
+                    self.finish(other_id, "SUPERSEDED")
+
+            logging.info(f"开始监控 {req_id}")
+            self.watchers[req_id] = dict(app=app, key=key, next_at=0, future=None, errors=0)
+
+    def finish(self, req_id: str, status: str, message: str = ""):
+        """
+        结束监控并写入结果
+        :param req_id: 请求id
+        :param status: 结束状态
+        :param message: 错误信息
+        """
+        watcher = self.watchers.pop(req_id, None)
+        if watcher:
+            watcher["app"].scheduler.summary()
+        dump_json(os.path.join(self.done_dir, f"{req_id}.json"), dict(status=status, message=message))
+        try:
+            os.remove(os.path.join(self.running_dir, f"{req_id}.json"))
+        except FileNotFoundError:
+            pass
+        logging.info(f"监控 {req_id} 结束, 状态: {status}")
+
+    def dispatch(self):
+        """
+        提交到期的轮询, 收集已完成轮询的结果
+        """
+        now = time.time()
+        for req_id, watcher in list(self.watchers.items()):
+            future = watcher["future"]
+            if future is None:
+                if watcher["next_at"] <= now:
+                    watcher["future"] = self.executor.submit(watcher["app"].step)
+                continue
+            if not future.done():
+                continue
+
+            watcher["future"] = None
+            try:
+                interval = future.result()
+            except Exception as e:
+                watcher["errors"] += 1
+                logging.error(f"监控 {req_id} 第 {watcher['errors']} 次失败: {e}")
+                if watcher["errors"] >= DaemonMaxErrors:
+                    self.finish(req_id, "ERROR", str(e))
+                else:
+                    watcher["next_at"] = now + watcher["app"].scheduler.min_interval
+                continue
+
+            watcher["errors"] = 0
+            if interval is None:
+                self.finish(req_id, watcher["app"].status)
+            else:
+                watcher["next_at"] = now + interval
+
+    def run(self, tick: float = 1):
+        for path in (self.queue_dir, self.running_dir, self.done_dir):
+            os.makedirs(path, mode=0o700, exist_ok=True)
+        with open(os.path.join(self.queue_dir, "daemon.pid"), 'w') as f:
+            f.write(str(os.getpid()))
+
+        # 接管上次退出时未完成的请求
+        for filename in os.listdir(self.running_dir):
+            os.replace(os.path.join(self.running_dir, filename), os.path.join(self.queue_dir, filename))
+
+        logging.info(f"监控守护进程已启动, 队列目录: {self.queue_dir}")
+        while True:
+            self.accept()
+            self.dispatch()
+            time.sleep(tick)
 
 
 def init_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--access_token', help='gitee access token', required=True, type=str)
-    parser.add_argument('--owner', help='owner', required=True, type=str)
-    parser.add_argument('--pr_id', help='pr id', required=True, type=str)
-    parser.add_argument('--repo', help='code repo', required=True, type=str)
-    parser.add_argument('--username', help='codearts username', required=True, type=str)
-    parser.add_argument('--subUsername', help='codearts subUsername', required=True, type=str)
-    parser.add_argument('--password', help='codearts password', required=True, type=str)
-    parser.add_argument('--obs_dic', help='obs_dic', required=True, type=str)
-    parser.add_argument('--ak', help='ak', required=True, type=str)
-    parser.add_argument('--sk', help='sk', required=True, type=str)
+    required = '--daemon' not in sys.argv[1:]
+    parser.add_argument('--access_token', help='gitee access token', required=required, type=str)
+    parser.add_argument('--owner', help='owner', required=required, type=str)
+    parser.add_argument('--pr_id', help='pr id', required=required, type=str)
+    parser.add_argument('--repo', help='code repo', required=required, type=str)
+    parser.add_argument('--username', help='codearts username', required=required, type=str)
+    parser.add_argument('--subUsername', help='codearts subUsername', required=required, type=str)
+    parser.add_argument('--password', help='codearts password', required=required, type=str)
+    parser.add_argument('--obs_dic', help='obs_dic', required=required, type=str)
+    parser.add_argument('--ak', help='ak', required=required, type=str)
+    parser.add_argument('--sk', help='sk', required=required, type=str)
     parser.add_argument('--project_id', help='current pipeline project id', type=str, default=None, required=False)
     parser.add_argument('--pipeline_id', help='current pipeline id', type=str, default=None, required=False)
     parser.add_argument('--pipeline_run_id', help='current pipeline run id', type=str, default=None, required=False)
     parser.add_argument('--remove_detail', help='remove detail column', type=str, default="true", required=False)
+    parser.add_argument('--max_workers', help='max concurrent log jobs', type=int, default=LogWorkers, required=False)
+    parser.add_argument('--poll_min_interval', help='min poll interval(s)', type=float, default=PollMinInterval,
+                        required=False)
+    parser.add_argument('--poll_max_interval', help='max poll interval(s)', type=float, default=PollMaxInterval,
+                        required=False)
+    parser.add_argument('--daemon', help='run as multi-pr monitor daemon', action='store_true')
+    parser.add_argument('--no_daemon', help='monitor in current process even if daemon is running',
+                        action='store_true')
+    parser.add_argument('--queue_dir', help='daemon request queue dir', type=str, default=DaemonQueueDir,
+                        required=False)
+    parser.add_argument('--daemon_workers', help='max concurrent polls in daemon', type=int, default=DaemonWorkers,
+                        required=False)
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     args = init_args()
 
-    checklist_remark = ChecklistApp(token=args.access_token,
-                                    owner=args.owner,
-                                    repo=args.repo,
-                                    pr_id=args.pr_id,
-                                    project_id=args.project_id,
-                                    pipeline_id=args.pipeline_id,
-                                    pipeline_run_id=args.pipeline_run_id,
-                                    username=args.username,
-                                    subUsername=args.subUsername,
-                                    password=args.password,
-                                    obs_dict=args.obs_dict,
-                                    ak=args.ak,
-                                    sk=args.sk,
-                                    remove_detail=args.remove_detail
-                                    )
-
+    if args.daemon:
+        MonitorDaemon(queue_dir=args.queue_dir, max_workers=args.daemon_workers).run()
+        sys.exit(0)
+
+    request = dict(token=args.access_token,
+                   owner=args.owner,
+                   repo=args.repo,
+                   pr_id=args.pr_id,
+                   project_id=args.project_id,
+                   pipeline_id=args.pipeline_id,
+                   pipeline_run_id=args.pipeline_run_id,
+                   username=args.username,
+                   subUsername=args.subUsername,
+                   password=args.password,
+                   obs_dict=args.obs_dic,
+                   ak=args.ak,
+                   sk=args.sk,
+                   remove_detail=args.remove_detail,
+                   max_workers=args.max_workers,
+                   poll_min_interval=args.poll_min_interval,
+                   poll_max_interval=args.poll_max_interval
+                   )
+
+    # 守护进程运行时, 作为客户端提交请求并等待结束
+    if not args.no_daemon and MonitorDaemon.is_alive(args.queue_dir):
+        req_id = MonitorDaemon.submit(args.queue_dir, request)
+        logging.info(f"已提交至监控守护进程, 请求id: {req_id}")
+        res = MonitorDaemon.wait(args.queue_dir, req_id)
+        if res is not None:
+            logging.info(f"监控结束, 状态: {res.get('status')} {res.get('message', '')}")
+            sys.exit(1 if res.get("status") == "ERROR" else 0)
+        logging.info("守护进程已退出, 在本进程中继续监控")
+
+    checklist_remark = ChecklistApp(**request)
     checklist_remark.run()
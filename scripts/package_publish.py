@@ -1,15 +1,30 @@
 #! -*- coding: utf-8 -*-
 
 import argparse
-import os
-import subprocess
-import requests
+import sys
+import json
+import time
+import functools
 import logging
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from tools.http_client import http_client
+from tools.multipart_stream import MultipartStream
+from tools.obs_client import ObsClient
+from tools.artifact_cache import ArtifactCache
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
 
 OBSAddr = "obs.cn-north-4.myhuaweicloud.com"
 OBSName = "opensourceways-ci"
+UploadTimeout = (10, 600)  # 上传附件的超时时间(连接, 读取), 单位秒
+UploadRetry = 3  # 上传附件的最大尝试次数
+PublishWorkers = 4  # 并发下载/上传的制品数
+CacheDir = "/tmp/artifact_cache"  # 制品缓存目录, 与下载目录在同一文件系统时可硬链接
+CacheSize = 50  # 制品缓存容量(GB)
 
 
 class GiteeApp:
@@ -45,14 +60,14 @@ class GiteeApp:
         :return:
         """
         url = f"https://gitee.com/api/v5/repos/{self.owner}/{self.repo}/releases?access_token={self.token}"
-        response = requests.post(url,
-                                 json=dict(tag_name=tag_name,
-                                           name=name,
-                                           body=body,
-                                           prerelease=prerelease,
-                                           target_commitish=target_commitish
-                                           )
-                                 )
+        response = http_client.post(url,
+                                    json=dict(tag_name=tag_name,
+                                              name=name,
+                                              body=body,
+                                              prerelease=prerelease,
+                                              target_commitish=target_commitish
+                                              )
+                                    )
 
         logging.info(f"Create release: {response.text}")
 
@@ -62,58 +77,256 @@ class GiteeApp:
 
         raise Exception("Create Release failure...")
 
+    def get_release_by_tag(self, tag_name: str):
+        """
+        根据标签查找已有的Release
+        :param tag_name: 标签名称
+        :return: Release ID, 不存在时返回None
+        """
+        url = f"https://gitee.com/api/v5/repos/{self.owner}/{self.repo}/releases/tags/{quote(tag_name, safe='')}"
+        response = http_client.get(url, params=dict(access_token=self.token))
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise Exception(f"Get Release by tag {tag_name} failure...")
+        data = response.json() if response.text.strip() else None
+        return data.get("id") if data else None
+
+    def ensure_release(self,
+                       tag_name: str,
+                       name: str,
+                       body: str,
+                       prerelease: bool = False,
+                       target_commitish: str = None
+                       ):
+        """
+        标签已有Release时直接复用, 否则创建, 使重复执行不会创建重复的Release
+        :param tag_name: 标签名称, Eg: V1.0.0
+        :param name: Release名称
+        :param body: 描述文件
+        :param prerelease: 是否为预览版本
+        :param target_commitish: 分支名称或者commit SHA
+        :return: Release ID
+        """
+        release_id = self.get_release_by_tag(tag_name)
+        if release_id:
+            logging.info(f"Reuse release {release_id} of tag {tag_name}")
+            return release_id
+        return self.creat_release(tag_name=tag_name,
+                                  name=name,
+                                  body=body,
+                                  prerelease=prerelease,
+                                  target_commitish=target_commitish)
+
+    def get_attach_files(self, release_id: str) -> list:
+        """
+        获取Release的附件列表
+        :param release_id: Release ID
+        :return:
+        """
+        url = f"https://gitee.com/api/v5/repos/{self.owner}/{self.repo}/releases/{release_id}/attach_files"
+        response = http_client.get(url, params=dict(access_token=self.token, per_page=100))
+        if response.status_code != 200:
+            raise Exception(f"Get attach files of Release: {release_id} failure...")
+        return response.json()
+
+    def delete_attach_file(self, release_id: str, attach_file_id: str):
+        """
+        删除Release的附件
+        :param release_id: Release ID
+        :param attach_file_id: 附件ID
+        :return:
+        """
+        url = f"https://gitee.com/api/v5/repos/{self.owner}/{self.repo}/releases/{release_id}/attach_files/{attach_file_id}"
+        response = http_client.delete(url, params=dict(access_token=self.token))
+        logging.info(f"Delete attach file {attach_file_id} of Release: {release_id}, status: {response.status_code}")
+
+    def find_attach_file(self, release_id: str, name: str):
+        """
+        按文件名查找Release的附件, 查询失败时返回None
+        :param release_id: Release ID
+        :param name: 文件名
+        :return:
+        """
+        try:
+            attach_files = self.get_attach_files(release_id)
+        except Exception as e:
+            logging.error(e)
+            return None
+        return next((x for x in attach_files if x.get("name") == name), None)
+
     def upload_attach_file(self,
                            release_id: str,
                            file: str):
         """
-
+        流式上传附件, 失败时复用同一个文件句柄重试, 上传后校验附件大小
         :param release_id: Release ID
         :param file: 文件路径
         :return:
         """
-        url = f"https://gitee.com/api/v5/repos/{self.owner}/{self.repo}/releases/{release_id}/attach_files?access_token={self.token}"
-        files = {"file": open(file, "rb")}
-        response = requests.post(url,
-                                 files=files
-                                 )
-        logging.info(f"Upload file to Release: {release_id}, result: {response.text}")
+        url = f"https://gitee.com/api/v5/repos/{self.owner}/{self.repo}/releases/{release_id}/attach_files"
+        with MultipartStream(file) as stream:
+            for i in range(UploadRetry):
+                stream.rewind()
+                start = time.time()
+                try:
+                    response = http_client.post(url,
+                                                params=dict(access_token=self.token),
+                                                data=stream,
+                                                headers={"Content-Type": stream.content_type},
+                                                timeout=UploadTimeout
+                                                )
+                    logging.info(f"Upload file to Release: {release_id}, status: {response.status_code}, "
+                                 f"result: {response.text}")
+                    data = response.json() if response.status_code in [200, 201, 204] else None
+                except (requests.RequestException, ValueError) as e:
+                    logging.error(f"Upload file to Release: {release_id} failed: {e}")
+                    data = None
+                stream.report(force=True)
 
-        if response.status_code in [200, 201, 204]:
-            return response.status_code
+                # 请求失败时服务端可能已经保存了附件
+                attach = data if isinstance(data, dict) and data.get("size") is not None \
+                    else self.find_attach_file(release_id, stream.file_name)
+                if attach and int(attach.get("size") or -1) == stream.file_size:
+                    logging.info(f"Upload {stream.file_name} ({stream.file_size} bytes) to Release: {release_id} "
+                                 f"cost {time.time() - start:.1f}s, sha256: {stream.hexdigest()}")
+                    return attach
+                if attach:
+                    logging.error(f"Attach file {stream.file_name} size {attach.get('size')} "
+                                  f"not match local size {stream.file_size}")
+                    self.delete_attach_file(release_id, attach.get("id"))
+
+                logging.info(f"upload {stream.file_name} failed {i + 1} times...")
+                time.sleep(5)
 
         raise Exception(f"Upload File to Release: {release_id} failure...")
 
 
-def download_file_from_obs(obs_path: str,
+def download_file_from_obs(obs_client: ObsClient,
+                           obs_path: str,
                            file_name: str,
-                           ak: str,
-                           sk: str,
                            obs_name: str,
-                           obs_addr: str = OBSAddr
+                           cache: ArtifactCache = None
                            ) -> str:
     """
-    从obs下载制品
+    从obs分段并发下载制品, 命中缓存时直接链接缓存文件
+    :param obs_client: obs客户端
     :param obs_path: 制品在obs上的路径
     :param file_name: 包名
-    :param ak:
-    :param sk:
     :param obs_name: obs桶名
-    :param obs_addr: obs地址
-    :return:
+    :param cache: 制品缓存, 为空时不使用缓存
+    :return: 本地文件路径
     """
     local_path = "/tmp/data"
-    if not os.path.exists(local_path):
-        os.makedirs(local_path)
-
-    subprocess.call(
-        f"""
-        cd {local_path}
-        obsutil config -i={ak} -k={sk} -e={obs_addr}
-        obsutil cp obs://{obs_name}/{obs_path} {local_path}/{file_name} -r -f
-        """,
-        shell=True
-    )
-    return "{local_path}/{file_name}"
+    file_path = f"{local_path}/{file_name}"
+    if cache is None:
+        return obs_client.download(obs_name, obs_path, file_path)["path"]
+
+    meta = obs_client.head(obs_name, obs_path)
+    if not meta["etag"]:
+        return obs_client.download(obs_name, obs_path, file_path, meta=meta)["path"]
+
+    key = cache.make_key(obs_name, obs_path, meta["etag"])
+    cached = cache.get(key)
+    if cached:
+        logging.info(f"artifact cache hit: obs://{obs_name}/{obs_path}")
+    else:
+        res = obs_client.download(obs_name, obs_path, cache.staging_path(key), meta=meta)
+        cached = cache.put(key, res["path"])
+    return cache.link(cached, file_path)
+
+
+def load_artifacts(args) -> list:
+    """
+    汇总命令行和清单文件中的制品
+    :param args: 命令行参数
+    :return: [{obs_path, file_name}]
+    """
+    artifacts = [dict(obs_path=x, file_name=y) for x, y in args.artifact or []]
+    if args.obs_path and args.file_name:
+        artifacts.append(dict(obs_path=args.obs_path, file_name=args.file_name))
+    if args.manifest:
+        with open(args.manifest, 'r') as f:
+            artifacts.extend(dict(obs_path=x["obs_path"], file_name=x["file_name"]) for x in json.load(f))
+
+    names = [x["file_name"] for x in artifacts]
+    if len(names) != len(set(names)):
+        raise ValueError(f"duplicate release attach file name in {names}")
+    return artifacts
+
+
+def publish_artifacts(app: GiteeApp,
+                      obs_client: ObsClient,
+                      release_id: str,
+                      artifacts: list,
+                      workers: int = PublishWorkers,
+                      cache: ArtifactCache = None
+                      ) -> list:
+    """
+    并发下载制品, 每个制品下载完成后立即并发上传至Release
+    Release中已有同名且大小一致的附件时跳过该制品, 大小不一致时删除后重新上传
+    :param app: GiteeApp
+    :param obs_client: obs客户端
+    :param release_id: Release ID
+    :param artifacts: [{obs_path, file_name}]
+    :param workers: 并发数
+    :param cache: 制品缓存
+    :return: 各制品的发布结果
+    """
+    def download(artifact: dict) -> dict:
+        res = dict(artifact, status="success", download=0.0, upload=0.0, error="")
+        start = time.time()
+        try:
+            attach = attach_files.get(artifact["file_name"])
+            if attach:
+                size = obs_client.head(OBSName, artifact["obs_path"])["size"]
+                if int(attach.get("size") or -1) == size:
+                    logging.info(f"{artifact['file_name']} already attached to Release: {release_id}, skip")
+                    res["status"] = "skipped"
+                    return res
+                logging.info(f"{artifact['file_name']} attached size {attach.get('size')} not match obs size {size}")
+                app.delete_attach_file(release_id, attach.get("id"))
+
+            res["path"] = download_file_from_obs(obs_client=obs_client,
+                                                 obs_path=artifact["obs_path"],
+                                                 file_name=artifact["file_name"],
+                                                 obs_name=OBSName,
+                                                 cache=cache)
+        except Exception as e:
+            res.update(status="download failed", error=str(e))
+            logging.error(f"download {artifact['obs_path']} failed: {e}")
+        res["download"] = time.time() - start
+        return res
+
+    def upload(res: dict) -> dict:
+        if res["status"] != "success":
+            return res
+        start = time.time()
+        try:
+            app.upload_attach_file(release_id=release_id, file=res["path"])
+        except Exception as e:
+            res.update(status="upload failed", error=str(e))
+            logging.error(f"upload {res['file_name']} failed: {e}")
+        res["upload"] = time.time() - start
+        return res
+
+    def on_downloaded(index: int, future):
+        # 下载完成后立即提交上传, 不等待其他制品
+        uploads[index] = upload_executor.submit(upload, future.result())
+
+    attach_files = {x.get("name"): x for x in app.get_attach_files(release_id)}
+    workers = max(1, workers)
+    uploads = [None] * len(artifacts)
+    with ThreadPoolExecutor(max_workers=workers) as upload_executor, \
+            ThreadPoolExecutor(max_workers=workers) as download_executor:
+        for i, artifact in enumerate(artifacts):
+            download_executor.submit(download, artifact).add_done_callback(functools.partial(on_downloaded, i))
+    results = [x.result() for x in uploads]
+
+    for res in results:
+        logging.info(f"{res['file_name']}: {res['status']}, download {res['download']:.1f}s, "
+                     f"upload {res['upload']:.1f}s {res['error']}")
+    return results
 
 
 def init_args():
@@ -127,36 +340,45 @@ def init_args():
     parser.add_argument('--name', help='release name, eg: Release For v0.0.1', required=True, type=str)
     parser.add_argument('--body', help='release desc', required=True, type=str)
     parser.add_argument('--commit_id', help='release bind commit id', required=True, type=str)
-    parser.add_argument('--file_name', help='release attach file name', required=True, type=str)
-    parser.add_argument('--commit_id', help='release bind commit id', required=True, type=str)
-    parser.add_argument('--obs_path', help='file in obs path', required=True, type=str)
+    parser.add_argument('--file_name', help='release attach file name', type=str)
+    parser.add_argument('--obs_path', help='file in obs path', type=str)
+    parser.add_argument('--artifact', help='obs path and release attach file name, can be repeated',
+                        nargs=2, action='append', metavar=('OBS_PATH', 'FILE_NAME'))
+    parser.add_argument('--manifest', help='json file of [{"obs_path": ..., "file_name": ...}]', type=str)
+    parser.add_argument('--workers', help='parallel downloads/uploads', type=int, default=PublishWorkers)
+    parser.add_argument('--obs_addr', help='obs endpoint, eg: http://127.0.0.1:9000', type=str, default=OBSAddr)
+    parser.add_argument('--path_style', help='put bucket name in url path instead of host', action='store_true')
+    parser.add_argument('--signature', help='obs: OBS signature, aws: AWS signature for s3 compatible storage',
+                        choices=["obs", "aws"], default="obs")
+    parser.add_argument('--cache_dir', help='local artifact cache dir, empty means disabled', type=str,
+                        default=CacheDir)
+    parser.add_argument('--cache_size', help='artifact cache size limit in GB', type=float, default=CacheSize)
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     args = init_args()
+    artifacts = load_artifacts(args)
+    if not artifacts:
+        raise ValueError("no artifact to publish, use --obs_path/--file_name, --artifact or --manifest")
 
     app = GiteeApp(token=args.token, owner=args.owner, repo=args.repo)
 
-    # 1. 将制品从obs下载至本地
-    file_path = download_file_from_obs(obs_path=args.obs_path,
-                                       file_name=args.file_name,
-                                       ak=args.ak,
-                                       sk=args.sk,
-                                       obs_name=OBSName,
-                                       obs_addr=OBSAddr,
-                                       )
-
-    # 2. 创建release
-    release_id = app.creat_release(
+    # 1. 初始化obs客户端
+    obs_client = ObsClient(ak=args.ak, sk=args.sk, endpoint=args.obs_addr, signature=args.signature,
+                           path_style=args.path_style)
+    cache = ArtifactCache(args.cache_dir, int(args.cache_size * 1024 ** 3)) if args.cache_dir else None
+
+    # 2. 创建release, 已存在时复用
+    release_id = app.ensure_release(
         tag_name=args.tag_name,
         name=args.name,
         body=args.body,
         target_commitish=args.commit_id
     )
 
-    # 3. 上传相应分支的附件
-    app.upload_attach_file(
-        release_id=release_id,
-        file=file_path
-    )
+    # 3. 并发将制品从obs下载至本地并上传为release附件
+    results = publish_artifacts(app=app, obs_client=obs_client, release_id=release_id, artifacts=artifacts,
+                                workers=args.workers, cache=cache)
+    if any(x["status"] not in ["success", "skipped"] for x in results):
+        sys.exit(1)
@@ -0,0 +1,116 @@
+#! -*- coding: utf-8 -*-
+
+import os
+import uuid
+import hashlib
+import logging
+import subprocess
+
+from tools.utils import file_lock
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
+
+
+class ArtifactCache:
+
+    def __init__(self,
+                 root: str,
+                 max_size: int
+                 ):
+        """
+        按obs对象和ETag寻址的本地制品缓存, 超过容量时按最近使用时间淘汰
+        :param root: 缓存目录
+        :param max_size: 缓存容量(字节)
+        """
+        self.root = root
+        self.max_size = max_size
+        self.objects_dir = os.path.join(root, "objects")
+        self.staging_dir = os.path.join(root, "staging")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(bucket: str, path: str, etag: str) -> str:
+        """
+        根据桶名、对象路径和ETag生成缓存key
+        :param bucket: 桶名
+        :param path: 对象路径
+        :param etag: 对象ETag
+        :return:
+        """
+        return hashlib.sha256(f"{bucket}/{path.lstrip('/')}\n{etag}".encode("utf-8")).hexdigest()
+
+    def staging_path(self, key: str) -> str:
+        """
+        获取下载中文件的临时路径, 与缓存在同一文件系统以便直接移入
+        :param key: 缓存key
+        :return:
+        """
+        return os.path.join(self.staging_dir, f"{key}.{uuid.uuid4().hex}")
+
+    def get(self, key: str):
+        """
+        获取缓存文件并更新使用时间
+        :param key: 缓存key
+        :return: 缓存文件路径, 不存在时返回None
+        """
+        path = os.path.join(self.objects_dir, key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, src: str) -> str:
+        """
+        将已下载的文件移入缓存, 并淘汰超出容量的旧文件
+        :param key: 缓存key
+        :param src: 已下载的文件, 需与缓存在同一文件系统
+        :return: 缓存文件路径
+        """
+        path = os.path.join(self.objects_dir, key)
+        with file_lock(os.path.join(self.root, ".lock")):
+            os.replace(src, path)
+            self.evict(keep=path)
+        return path
+
+    def evict(self, keep: str = None):
+        """
+        按最近使用时间从旧到新删除缓存文件, 直到不超过容量
+        :param keep: 不删除的文件
+        """
+        entries = []
+        for name in os.listdir(self.objects_dir):
+            path = os.path.join(self.objects_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(x[1] for x in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+            logging.info(f"evict {path} from artifact cache, {size / 1024 ** 2:.1f}MB")
+
+    @staticmethod
+    def link(src: str, dest: str) -> str:
+        """
+        将缓存文件放到目标路径, 优先使用硬链接, 跨文件系统时使用reflink或复制
+        :param src: 缓存文件路径
+        :param dest: 目标路径
+        :return: 目标路径
+        """
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(src, dest)
+        except OSError:
+            subprocess.run(["cp", "--reflink=auto", src, dest], check=True)
+        return dest
@@ -1,15 +1,27 @@
 #!/bin/bash
 
+# 用法: collect_git_repo.sh <repo> <url> [full|sparse] [target_file]
+# sparse模式使用partial clone(--filter=blob:none)并只检出target_file
 repo=$1
 url=$2
+mode=${3:-full}
+target=${4:-OWNERS}
 work_dir="./data/repos"
 
 mkdir -p "${work_dir}" && cd "${work_dir}" || exit
 
 if [ -d "$repo" ]; then
   cd "$repo" || exit
-  git pull
+  git pull || exit 1
+  cd ..
+elif [ "$mode" = "sparse" ]; then
+  git clone --filter=blob:none --no-checkout "$url" "$repo" || exit 1
+  cd "$repo" || exit
+  # 直接写sparse-checkout文件, 兼容不支持sparse-checkout set --no-cone的旧版本git(< 2.35)
+  git config core.sparseCheckout true || exit 1
+  mkdir -p .git/info && echo "$target" > .git/info/sparse-checkout || exit 1
+  git read-tree -mu HEAD || exit 1
   cd ..
 else
-  git clone "$url"
+  git clone "$url" || exit 1
 fi
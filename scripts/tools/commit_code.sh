@@ -1,15 +1,35 @@
 #!/bin/bash
 
+# 用法: commit_code.sh <repo> [add_pathspec_file rm_pathspec_file]
+# pathspec文件为NUL分隔的路径列表, 指定时只暂存新增/修改和删除的路径
 repo=$1
+add_pathspec=$2
+rm_pathspec=$3
 
 cd "./data/repos/${repo}" || exit
 
-git add .
+if [ -n "$add_pathspec" ]; then
+  export GIT_LITERAL_PATHSPECS=1
+  if [ -s "$add_pathspec" ]; then
+    git add --pathspec-from-file="$add_pathspec" --pathspec-file-nul || exit 1
+  fi
+  if [ -s "$rm_pathspec" ]; then
+    git rm -q --cached --ignore-unmatch --pathspec-from-file="$rm_pathspec" --pathspec-file-nul || exit 1
+  fi
+else
+  git add .
+fi
 
-sleep 3
+if git diff --cached --quiet; then
+  echo "nothing to commit"
+else
+  git commit -m "update OWNERS" || exit 1
+fi
 
-git commit -m "update OWNERS"
+# 之前推送失败的本地提交也需要推送, 只有推送成功才算成功
+ahead=$(git rev-list --count "@{u}..HEAD" 2>/dev/null || echo 1)
+if [ "$ahead" -eq 0 ]; then
+  exit 0
+fi
 
-sleep 1
-
-git push
+git push || exit 1
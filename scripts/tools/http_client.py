@@ -0,0 +1,93 @@
+#! -*- coding: utf-8 -*-
+
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
+
+Timeout = (10, 60)  # 默认超时时间(连接, 读取), 单位秒
+PoolSize = 16  # 每个host的最大连接数
+
+
+class HttpClient:
+
+    def __init__(self,
+                 timeout: tuple = Timeout,
+                 pool_size: int = PoolSize
+                 ):
+        """
+        按host复用连接池的http客户端, 保持长连接
+        :param timeout: 默认超时时间(连接, 读取)
+        :param pool_size: 每个host的最大连接数
+        """
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get_session(self, url: str) -> requests.Session:
+        """
+        获取url所属host的会话, 不存在时创建
+        :param url: 请求地址
+        :return:
+        """
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                session.mount(host, HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+                self.sessions[host] = session
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        发送请求并记录耗时, 日志中不输出query参数以免泄露token
+        :param method: 请求方法
+        :param url: 请求地址
+        :param kwargs: 透传给requests的参数
+        :return:
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        parts = urlsplit(url)
+        target = f"{method.upper()} {parts.netloc}{parts.path}"
+
+        start = time.time()
+        try:
+            response = self.get_session(url).request(method, url, **kwargs)
+        except requests.RequestException as e:
+            logging.error(f"{target} failed after {(time.time() - start) * 1000:.0f}ms: {e}")
+            raise
+
+        logging.info(f"{target} {response.status_code} {(time.time() - start) * 1000:.0f}ms")
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        """
+        关闭所有会话
+        """
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+
+http_client = HttpClient()
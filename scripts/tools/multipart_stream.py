@@ -0,0 +1,110 @@
+#! -*- coding: utf-8 -*-
+
+import os
+import time
+import uuid
+import hashlib
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
+
+
+class MultipartStream:
+
+    def __init__(self,
+                 path: str,
+                 field: str = "file",
+                 file_name: str = None,
+                 content_type: str = "application/octet-stream",
+                 progress_interval: float = 10
+                 ):
+        """
+        流式的multipart/form-data请求体, 边读文件边发送, 内存占用与文件大小无关
+        文件句柄只打开一次, 重试时通过rewind回到开头, 用完需调用close或使用with
+        :param path: 文件路径
+        :param field: 表单字段名
+        :param file_name: 上传后的文件名, 默认与本地文件名一致
+        :param content_type: 文件类型
+        :param progress_interval: 输出进度的间隔(秒)
+        """
+        self.path = path
+        self.file_name = file_name or os.path.basename(path)
+        self.progress_interval = progress_interval
+        self.boundary = uuid.uuid4().hex
+        self.head = (f"--{self.boundary}\r\n"
+                     f"Content-Disposition: form-data; name=\"{field}\"; filename=\"{self.file_name}\"\r\n"
+                     f"Content-Type: {content_type}\r\n\r\n").encode("utf-8")
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self.file = open(path, "rb")
+        self.file_size = os.fstat(self.file.fileno()).st_size
+        self.sha256 = hashlib.sha256()
+        self.hashed = 0  # 已计算hash的文件字节数, 重试时不重复计算
+        self.rewind()
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self.head) + self.file_size + len(self.tail)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def rewind(self):
+        """
+        回到请求体开头, 用于重试
+        """
+        self.pos = 0
+        self.file.seek(0)
+        self.start = self.last_log = time.time()
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        按顺序读取表单头、文件内容和结束标记
+        :param size: 最多读取的字节数, 负数表示每次读取一块
+        :return:
+        """
+        size = size if size and size > 0 else 1024 * 1024
+        head_size = len(self.head)
+        if self.pos < head_size:
+            chunk = self.head[self.pos:self.pos + size]
+        elif self.pos < head_size + self.file_size:
+            offset = self.pos - head_size
+            chunk = self.file.read(min(size, self.file_size - offset))
+            if offset == self.hashed:
+                self.sha256.update(chunk)
+                self.hashed += len(chunk)
+        else:
+            offset = self.pos - head_size - self.file_size
+            chunk = self.tail[offset:offset + size]
+
+        self.pos += len(chunk)
+        self.report()
+        return chunk
+
+    def report(self, force: bool = False):
+        """
+        输出上传进度和速率
+        :param force: 是否忽略输出间隔
+        """
+        now = time.time()
+        if not force and now - self.last_log < self.progress_interval:
+            return
+        self.last_log = now
+        cost = max(now - self.start, 1e-6)
+        logging.info(f"upload {self.file_name}: {self.pos / 1024 ** 2:.1f}/{len(self) / 1024 ** 2:.1f}MB "
+                     f"({self.pos * 100 / max(len(self), 1):.1f}%), {self.pos / 1024 ** 2 / cost:.2f}MB/s")
+
+    def hexdigest(self) -> str:
+        """
+        文件内容的sha256, 至少完整发送过一次后才有效
+        :return:
+        """
+        return self.sha256.hexdigest() if self.hashed == self.file_size else ""
+
+    def close(self):
+        self.file.close()
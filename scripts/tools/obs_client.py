@@ -0,0 +1,189 @@
+#! -*- coding: utf-8 -*-
+
+import os
+import hmac
+import time
+import base64
+import hashlib
+import logging
+from email.utils import formatdate
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+from tools.http_client import http_client
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
+
+PartSize = 16 * 1024 * 1024  # 分段下载时每段大小
+Workers = 4  # 单个对象并发下载的分段数
+Retry = 3  # 单个分段的最大尝试次数
+ChunkSize = 1024 * 1024  # 读取响应和计算md5时的块大小
+
+
+class ObsClient:
+
+    def __init__(self,
+                 ak: str,
+                 sk: str,
+                 endpoint: str,
+                 signature: str = "obs",
+                 path_style: bool = False,
+                 client=http_client
+                 ):
+        """
+        使用AK/SK签名的obs(兼容s3)客户端, 支持分段并发下载
+        :param ak:
+        :param sk:
+        :param endpoint: obs地址, 不带协议时使用https
+        :param signature: obs使用OBS签名和x-obs-头, aws使用AWS签名和x-amz-头
+        :param path_style: 是否将桶名放在路径中, 否则使用桶名子域名
+        :param client: http客户端
+        """
+        self.ak = ak
+        self.sk = sk
+        self.scheme, _, self.host = endpoint.rpartition("://")
+        self.scheme = self.scheme or "https"
+        self.host = self.host.rstrip("/")
+        self.signature = signature
+        self.header_prefix = "x-obs-" if signature == "obs" else "x-amz-"
+        self.path_style = path_style
+        self.client = client
+
+    def sign(self, method: str, bucket: str, key: str, headers: dict) -> dict:
+        """
+        按V2签名算法生成Authorization头
+        :param method: 请求方法
+        :param bucket: 桶名
+        :param key: 编码后的对象名
+        :param headers: 请求头
+        :return: 带签名的请求头
+        """
+        headers = dict(headers, Date=formatdate(usegmt=True))
+        lower = {k.lower(): str(v).strip() for k, v in headers.items()}
+        canonical_headers = "".join(f"{k}:{lower[k]}\n" for k in sorted(lower) if k.startswith(self.header_prefix))
+        string_to_sign = "\n".join([method, lower.get("content-md5", ""), lower.get("content-type", ""),
+                                    lower["date"], f"{canonical_headers}/{bucket}/{key}"])
+        digest = hmac.new(self.sk.encode("utf-8"), string_to_sign.encode("utf-8"), hashlib.sha1).digest()
+        headers["Authorization"] = f"{self.signature.upper()} {self.ak}:{base64.b64encode(digest).decode()}"
+        return headers
+
+    def request(self, method: str, bucket: str, key: str, headers: dict = None, **kwargs):
+        """
+        发送签名请求
+        :param method: 请求方法
+        :param bucket: 桶名
+        :param key: 对象名
+        :param headers: 请求头
+        :param kwargs: 透传给http客户端的参数
+        :return:
+        """
+        key = quote(key.lstrip("/"), safe="/~")
+        if self.path_style:
+            url = f"{self.scheme}://{self.host}/{bucket}/{key}"
+        else:
+            url = f"{self.scheme}://{bucket}.{self.host}/{key}"
+        return self.client.request(method, url, headers=self.sign(method, bucket, key, headers or {}), **kwargs)
+
+    def head(self, bucket: str, key: str) -> dict:
+        """
+        获取对象大小和ETag
+        :param bucket: 桶名
+        :param key: 对象名
+        :return: size, etag
+        """
+        response = self.request("HEAD", bucket, key)
+        if response.status_code != 200:
+            raise Exception(f"head obs://{bucket}/{key} failed, status: {response.status_code}")
+        return dict(size=int(response.headers["Content-Length"]),
+                    etag=response.headers.get("ETag", "").strip('"'))
+
+    def download_part(self, bucket: str, key: str, fd: int, start: int, end: int, etag: str):
+        """
+        下载一个分段并写入文件对应位置, 失败时从已写入的位置继续
+        :param bucket: 桶名
+        :param key: 对象名
+        :param fd: 已打开的文件描述符
+        :param start: 起始字节
+        :param end: 结束字节(包含)
+        :param etag: 对象ETag, 用于确认下载期间对象未被覆盖
+        """
+        offset, error = start, None
+        for i in range(Retry):
+            headers = {"Range": f"bytes={offset}-{end}"}
+            if etag:
+                headers["If-Match"] = f'"{etag}"'
+            try:
+                with self.request("GET", bucket, key, headers=headers, stream=True) as response:
+                    if response.status_code != 206:
+                        raise Exception(f"range get obs://{bucket}/{key} failed, status: {response.status_code}")
+                    for chunk in response.iter_content(ChunkSize):
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                if offset == end + 1:
+                    return
+                error = Exception(f"range {start}-{end} of obs://{bucket}/{key} incomplete at {offset}")
+            except Exception as e:
+                error = e
+            logging.error(f"download part {start}-{end} failed {i + 1} times: {error}")
+            time.sleep(i + 1)
+        raise error
+
+    def download(self,
+                 bucket: str,
+                 key: str,
+                 path: str,
+                 part_size: int = PartSize,
+                 workers: int = Workers,
+                 meta: dict = None
+                 ) -> dict:
+        """
+        将对象分段并发下载至预分配的文件, 完成后校验md5
+        :param bucket: 桶名
+        :param key: 对象名
+        :param path: 本地文件路径
+        :param part_size: 每段大小
+        :param workers: 并发数
+        :param meta: 已获取的对象大小和ETag, 为空时通过HEAD获取
+        :return: path, size, etag
+        """
+        start = time.time()
+        meta = meta or self.head(bucket, key)
+        size, etag = meta["size"], meta["etag"]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.downloading"
+
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if size:
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except (AttributeError, OSError):
+                    os.ftruncate(fd, size)
+            parts = [(x, min(x + part_size, size) - 1) for x in range(0, size, max(1, part_size))]
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(parts) or 1))) as executor:
+                futures = [executor.submit(self.download_part, bucket, key, fd, x, y, etag) for x, y in parts]
+                for future in futures:
+                    future.result()
+        except Exception:
+            os.close(fd)
+            os.remove(tmp_path)
+            raise
+        os.close(fd)
+
+        # 分段上传的对象ETag不是md5, 无法校验
+        if etag and "-" not in etag:
+            md5 = hashlib.md5()
+            with open(tmp_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(ChunkSize), b''):
+                    md5.update(chunk)
+            if md5.hexdigest() != etag.lower():
+                os.remove(tmp_path)
+                raise Exception(f"md5 of obs://{bucket}/{key} not match, expect {etag}, got {md5.hexdigest()}")
+        else:
+            logging.info(f"skip md5 check of obs://{bucket}/{key}, etag: {etag}")
+        os.replace(tmp_path, path)
+
+        cost = max(time.time() - start, 1e-6)
+        logging.info(f"download obs://{bucket}/{key} to {path}, {size / 1024 ** 2:.1f}MB "
+                     f"in {len(parts)} parts, cost {cost:.1f}s, {size / 1024 ** 2 / cost:.2f}MB/s")
+        return dict(path=path, size=size, etag=etag)
@@ -0,0 +1,136 @@
+#! -*- coding: utf-8 -*-
+
+import os
+import shutil
+import hashlib
+import fnmatch
+import logging
+import tempfile
+import threading
+import subprocess
+
+from tools.utils import file_lock, file_sha256, dump_json, load_json
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
+
+ConfigDir = os.path.expanduser("~/.obsutil_configs")  # 按(ak, endpoint)区分的obsutil配置文件目录
+
+
+class ObsUploader:
+    configured = set()  # 本进程已配置过的配置文件
+    config_lock = threading.Lock()
+
+    def __init__(self,
+                 ak: str,
+                 sk: str,
+                 endpoint: str,
+                 bucket: str,
+                 root: str,
+                 prefix: str = "",
+                 excludes: tuple = ()
+                 ):
+        """
+        基于内容hash清单的obs增量上传
+        :param ak:
+        :param sk:
+        :param endpoint: obs地址
+        :param bucket: obs桶名
+        :param root: 本地根目录, 目录结构与obs上保持一致
+        :param prefix: obs上的目录前缀
+        :param excludes: 不上传的文件名匹配规则
+        """
+        self.ak = ak
+        self.sk = sk
+        self.endpoint = endpoint
+        self.bucket = bucket
+        self.root = root
+        self.prefix = prefix.strip("/")
+        self.excludes = excludes
+        self.manifest_path = os.path.join(root, ".obs_manifest.json")
+        # obsutil默认只有一个全局配置, 不同凭据使用各自的配置文件, 避免相互覆盖
+        digest = hashlib.sha256(f"{ak}\n{endpoint}".encode("utf-8")).hexdigest()[:16]
+        self.config_path = os.path.join(ConfigDir, f"obsutil_{digest}.conf")
+
+    def configure(self) -> bool:
+        """
+        将obsutil凭据写入本实例的配置文件, 每个配置文件每个进程只配置一次
+        :return:
+        """
+        with self.config_lock:
+            if self.config_path in self.configured:
+                return True
+            os.makedirs(ConfigDir, mode=0o700, exist_ok=True)
+            code = subprocess.call(["obsutil", "config", f"-i={self.ak}", f"-k={self.sk}", f"-e={self.endpoint}",
+                                    f"-config={self.config_path}"], stdout=subprocess.DEVNULL)
+            if code != 0:
+                logging.error(f"obsutil config failed, exit code: {code}")
+                return False
+            os.chmod(self.config_path, 0o600)
+            self.configured.add(self.config_path)
+            return True
+
+    def changed_files(self, sub_dir: str, manifest: dict) -> dict:
+        """
+        找出sub_dir下新增或内容变化的文件, 大小和修改时间未变的文件不重新计算hash
+        :param sub_dir: 相对root的目录
+        :param manifest: 已上传文件清单, 相对路径 -> [size, mtime_ns, sha256]
+        :return: 相对路径 -> [size, mtime_ns, sha256]
+        """
+        res = {}
+        for path, _, file_lst in os.walk(os.path.join(self.root, sub_dir)):
+            for filename in file_lst:
+                if any(fnmatch.fnmatch(filename, pattern) for pattern in self.excludes):
+                    continue
+                full_path = os.path.join(path, filename)
+                rel_path = os.path.relpath(full_path, self.root)
+                stat = os.stat(full_path)
+                entry = manifest.get(rel_path)
+                if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+                    continue
+                digest = file_sha256(full_path)
+                if entry and entry[2] == digest:
+                    manifest[rel_path] = [stat.st_size, stat.st_mtime_ns, digest]
+                    continue
+                res[rel_path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return res
+
+    def upload(self, sub_dir: str) -> int:
+        """
+        将sub_dir下新增或变化的文件合并为一次上传
+        :param sub_dir: 相对root的目录
+        :return: 上传的文件数
+        """
+        with file_lock(f"{self.manifest_path}.lock"):
+            manifest = load_json(self.manifest_path)
+            changed = self.changed_files(sub_dir, manifest)
+            if not changed:
+                dump_json(self.manifest_path, manifest)
+                return 0
+            if not self.configure():
+                return 0
+
+            # 通过硬链接把待上传文件放到临时目录, 一次性上传
+            stage_dir = tempfile.mkdtemp(dir=self.root, prefix=".obs_stage_")
+            try:
+                for rel_path in changed:
+                    target = os.path.join(stage_dir, rel_path)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    try:
+                        os.link(os.path.join(self.root, rel_path), target)
+                    except OSError:
+                        shutil.copyfile(os.path.join(self.root, rel_path), target)
+
+                dest = f"obs://{self.bucket}/{self.prefix}/" if self.prefix else f"obs://{self.bucket}/"
+                code = subprocess.call(["obsutil", "cp", stage_dir, dest, "-r", "-f", "-flat",
+                                        f"-config={self.config_path}"])
+            finally:
+                shutil.rmtree(stage_dir, ignore_errors=True)
+
+            if code != 0:
+                logging.error(f"upload {sub_dir} to {self.bucket} failed, exit code: {code}")
+                return 0
+
+            manifest.update(changed)
+            dump_json(self.manifest_path, manifest)
+            logging.info(f"upload {len(changed)} files of {sub_dir} to {self.bucket}")
+            return len(changed)
@@ -0,0 +1,149 @@
+#! -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import argparse
+import logging
+
+try:
+    from tools.utils import dump_json, load_json
+except ModuleNotFoundError:
+    # 作为脚本直接运行时(python tools/owners_index.py), tools目录本身在搜索路径中
+    from utils import dump_json, load_json
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
+
+OwnerRoles = ("approvers", "reviewers")
+
+
+def parse_owners(text: str) -> dict:
+    """
+    解析OWNERS文件中的approvers和reviewers列表, 只支持简单的yaml列表写法
+    :param text: 文件内容
+    :return: approvers/reviewers -> 用户名列表
+    """
+    res = {x: [] for x in OwnerRoles}
+    key = None
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].rstrip()
+        if not line.strip():
+            continue
+
+        match = re.match(r"^([\w-]+)\s*:\s*(.*)$", line)
+        if match and not line[0].isspace():
+            key, value = match.group(1), match.group(2).strip()
+            # 行内列表, 如 reviewers: [a, b]
+            if key in res and value.startswith("[") and value.endswith("]"):
+                res[key].extend(x.strip().strip("'\"") for x in value[1:-1].split(",") if x.strip())
+            continue
+
+        match = re.match(r"^\s*-\s*(.+)$", line)
+        if match and key in res:
+            res[key].append(match.group(1).strip().strip("'\""))
+
+    return {k: list(dict.fromkeys(v)) for k, v in res.items()}
+
+
+class OwnersIndex:
+
+    def __init__(self, path: str):
+        """
+        OWNERS归属索引, 按OWNERS文件所在目录记录owners, 按用户记录其负责的目录
+        :param path: 索引文件路径
+        """
+        self.path = path
+        data = load_json(path)
+        self.owners = data.get("owners", {})  # 目录 -> approvers/reviewers -> 用户名列表
+        self.people = data.get("people", {})  # 用户名 -> approvers/reviewers -> 目录列表
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def remove(self, prefix: str):
+        """
+        删除目录的owners记录
+        :param prefix: OWNERS文件所在目录
+        """
+        entry = self.owners.pop(prefix, {})
+        for role, users in entry.items():
+            for user in users:
+                dirs = self.people.get(user, {}).get(role, [])
+                if prefix in dirs:
+                    dirs.remove(prefix)
+                if not any(self.people.get(user, {}).values()):
+                    self.people.pop(user, None)
+
+    def add(self, prefix: str, entry: dict):
+        """
+        添加目录的owners记录
+        :param prefix: OWNERS文件所在目录
+        :param entry: approvers/reviewers -> 用户名列表
+        """
+        self.remove(prefix)
+        if not any(entry.values()):
+            return
+        self.owners[prefix] = entry
+        for role, users in entry.items():
+            for user in users:
+                self.people.setdefault(user, {}).setdefault(role, []).append(prefix)
+
+    def update(self, root: str, paths: list) -> int:
+        """
+        根据有变化的OWNERS文件增量更新索引并保存
+        :param root: OWNERS文件所在的根目录
+        :param paths: 相对root的OWNERS文件路径, 文件不存在时删除对应记录
+        :return: 更新的记录数
+        """
+        for rel_path in paths:
+            prefix = os.path.dirname(rel_path)
+            full_path = os.path.join(root, rel_path)
+            if not os.path.isfile(full_path):
+                self.remove(prefix)
+                continue
+            with open(full_path, 'r', encoding="utf-8", errors="replace") as f:
+                self.add(prefix, parse_owners(f.read()))
+
+        dump_json(self.path, dict(owners=self.owners, people=self.people))
+        logging.info(f"owners index updated with {len(paths)} files, {len(self.owners)} dirs, {len(self.people)} users")
+        return len(paths)
+
+    def owners_of(self, path: str) -> dict:
+        """
+        查找路径的owners, 使用离路径最近的OWNERS文件
+        :param path: 代码仓名称开头的路径, 如 repo/src/main.py
+        :return: dir: OWNERS文件所在目录, approvers/reviewers -> 用户名列表
+        """
+        prefix = path.strip("/")
+        while prefix:
+            if prefix in self.owners:
+                return dict(dir=prefix, **self.owners[prefix])
+            prefix = os.path.dirname(prefix)
+        return {}
+
+    def dirs_of(self, user: str) -> dict:
+        """
+        查找用户负责的目录
+        :param user: 用户名
+        :return: approvers/reviewers -> 目录列表
+        """
+        return {k: sorted(v) for k, v in self.people.get(user, {}).items()}
+
+
+def init_args():
+    parser = argparse.ArgumentParser(description="query owners index")
+    parser.add_argument('--index', help='index file path, eg: data/ascend_owners_index.json', required=True, type=str)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--user', help='list dirs owned by this user', type=str)
+    group.add_argument('--path', help='find owners of this path, eg: repo/src/main.py', type=str)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = init_args()
+    index = OwnersIndex(args.index)
+    if not index.exists():
+        raise FileNotFoundError(f"owners index {args.index} not exists")
+
+    res = index.dirs_of(args.user) if args.user else index.owners_of(args.path)
+    print(json.dumps(res, ensure_ascii=False, indent=2))
@@ -0,0 +1,116 @@
+#! -*- coding: utf-8 -*-
+
+import time
+import logging
+
+from tools.utils import file_lock, dump_json, load_json
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
+
+RunningStatus = "RUNNING"
+
+
+class PollScheduler:
+
+    def __init__(self,
+                 min_interval: float,
+                 max_interval: float,
+                 backoff: float = 1.5,
+                 durations: dict = None,
+                 durations_path: str = None
+                 ):
+        """
+        根据任务状态自适应调整轮询间隔
+        :param min_interval: 最小轮询间隔(秒)
+        :param max_interval: 最大轮询间隔(秒)
+        :param backoff: 状态无变化时间隔的放大倍数
+        :param durations: 任务名称 -> 历史耗时(秒), 可在多个调度器间共享
+        :param durations_path: 历史耗时的持久化文件, 用于在多次运行间积累耗时数据
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self.durations = durations if durations is not None else {}
+        self.durations_path = durations_path
+        if durations_path:
+            with file_lock(f"{durations_path}.lock"):
+                self.durations.update(load_json(durations_path))
+        self.interval = min_interval
+        self.job_states = {}
+        self.running_since = {}
+        self.poll_costs = []
+
+    def remaining(self, now: float) -> float:
+        """
+        根据历史耗时估算运行中任务最早的剩余时间, 无历史数据时返回None
+        :param now: 当前时间戳
+        :return:
+        """
+        res = None
+        for name, since in self.running_since.items():
+            if name not in self.durations:
+                continue
+            left = self.durations[name] - (now - since)
+            res = left if res is None else min(res, left)
+        return res
+
+    def save_duration(self, name: str, duration: float):
+        """
+        记录任务耗时, 配置了持久化文件时同时写入文件
+        :param name: 任务名称
+        :param duration: 耗时(秒)
+        """
+        self.durations[name] = duration
+        if not self.durations_path:
+            return
+        with file_lock(f"{self.durations_path}.lock"):
+            data = load_json(self.durations_path)
+            data[name] = duration
+            dump_json(self.durations_path, data)
+
+    def next_interval(self, status: str, jobs: dict, cost: float = 0.0):
+        """
+        记录本次轮询结果, 计算下一次轮询间隔
+        :param status: 流水线状态
+        :param jobs: 任务名称 -> 任务状态
+        :param cost: 本次轮询耗时(秒)
+        :return: 下一次轮询间隔(秒), 流水线已结束时返回None
+        """
+        now = time.time()
+        self.poll_costs.append(cost)
+
+        changed = False
+        for name, job_status in jobs.items():
+            if self.job_states.get(name) != job_status:
+                changed = True
+            if job_status == RunningStatus:
+                self.running_since.setdefault(name, now)
+            elif name in self.running_since:
+                self.save_duration(name, now - self.running_since.pop(name))
+        self.job_states = dict(jobs)
+
+        if status != RunningStatus:
+            return None
+
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+        # 有任务即将结束时缩短间隔
+        left = self.remaining(now)
+        if left is not None and left < self.interval:
+            self.interval = max(self.min_interval, left)
+
+        logging.info(f"next poll in {self.interval:.0f}s, poll cost {cost:.2f}s")
+        return self.interval
+
+    def summary(self):
+        """
+        输出轮询耗时统计
+        """
+        if not self.poll_costs:
+            return
+        total = sum(self.poll_costs)
+        logging.info(f"poll times: {len(self.poll_costs)}, "
+                     f"avg cost: {total / len(self.poll_costs):.2f}s, max cost: {max(self.poll_costs):.2f}s")
@@ -0,0 +1,220 @@
+#! -*- coding: utf-8 -*-
+
+import os
+import json
+import sqlite3
+import argparse
+import logging
+from datetime import datetime
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
+
+Schema = """
+CREATE TABLE IF NOT EXISTS repos (
+    name TEXT PRIMARY KEY,
+    repo_id INTEGER,
+    prev_name TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    removed_at TEXT,
+    renamed_at TEXT,
+    pushed_at TEXT,
+    default_branch TEXT,
+    size INTEGER,
+    synced_pushed_at TEXT,
+    synced_at TEXT,
+    sync_status TEXT,
+    sync_error TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_repos_repo_id ON repos (repo_id);
+CREATE INDEX IF NOT EXISTS idx_repos_first_seen ON repos (first_seen);
+CREATE INDEX IF NOT EXISTS idx_repos_removed_at ON repos (removed_at);
+CREATE INDEX IF NOT EXISTS idx_repos_renamed_at ON repos (renamed_at);
+"""
+
+
+def now_str() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class RepoInventory:
+
+    def __init__(self, path: str):
+        """
+        基于sqlite的代码仓清单, 记录首次/最后发现时间、元数据和同步状态
+        :param path: 数据库文件路径
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self.connect() as conn:
+            conn.executescript(Schema)
+
+    @contextmanager
+    def connect(self):
+        """
+        每次操作使用独立连接, 以便在多个线程中使用, 退出时提交事务
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def is_empty(self) -> bool:
+        with self.connect() as conn:
+            return conn.execute("SELECT 1 FROM repos LIMIT 1").fetchone() is None
+
+    def import_names(self, path: str) -> int:
+        """
+        从旧的代码仓列表文本文件导入, 每行一个代码仓名称
+        代码仓在文件最后一次写入时已经存在, 以文件修改时间作为首次发现时间, 避免迁移当天全部被视为新增
+        :param path: 文本文件路径
+        :return: 导入的代码仓数
+        """
+        with open(path, 'r') as f:
+            names = [x.strip() for x in f if x.strip()]
+        seen_at = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+        with self.connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO repos (name, first_seen, last_seen) VALUES (?, ?, ?)",
+                             [(x, seen_at, seen_at) for x in names])
+        logging.info(f"import {len(names)} repos from {path}")
+        return len(names)
+
+    def import_sync_state(self, state: dict) -> int:
+        """
+        导入旧的json同步记录, 不在清单中的代码仓以同步时间作为首次发现时间
+        :param state: 代码仓名称 -> {pushed_at, synced_at}
+        :return: 导入的记录数
+        """
+        now = now_str()
+        with self.connect() as conn:
+            for name, entry in state.items():
+                seen_at = entry.get("synced_at") or now
+                conn.execute("INSERT OR IGNORE INTO repos (name, first_seen, last_seen) VALUES (?, ?, ?)",
+                             (name, seen_at, seen_at))
+                conn.execute("UPDATE repos SET synced_pushed_at = ?, synced_at = ?, sync_status = 'success' "
+                             "WHERE name = ?", (entry.get("pushed_at"), entry.get("synced_at"), name))
+        logging.info(f"import {len(state)} sync records")
+        return len(state)
+
+    def update(self, repos: dict, seen_at: str = None, partial: bool = False) -> dict:
+        """
+        根据最新的代码仓列表更新清单, 通过代码仓id识别重命名
+        :param repos: 代码仓名称 -> {id, pushed_at, default_branch, size}, 缺少的字段保留原值
+        :param seen_at: 发现时间, 默认为当前时间
+        :param partial: repos是否只是部分代码仓, 为True时不标记不在repos中的代码仓为删除
+        :return: new: 新增的代码仓, removed: 删除的代码仓, renamed: (旧名称, 新名称)
+        """
+        seen_at = seen_at or now_str()
+        new, removed, renamed = [], [], []
+        with self.connect() as conn:
+            for name, info in repos.items():
+                repo_id = info.get("id")
+                row = None
+                if repo_id is not None:
+                    row = conn.execute("SELECT name, removed_at FROM repos WHERE repo_id = ?", (repo_id,)).fetchone()
+                if row is not None and row["name"] != name:
+                    # 新名称被已删除的旧记录占用时, 以当前代码仓为准
+                    conn.execute("DELETE FROM repos WHERE name = ?", (name,))
+                    conn.execute("UPDATE repos SET name = ?, prev_name = ?, renamed_at = ? WHERE repo_id = ?",
+                                 (name, row["name"], seen_at, repo_id))
+                    renamed.append((row["name"], name))
+                if row is None:
+                    row = conn.execute("SELECT name, removed_at FROM repos WHERE name = ?", (name,)).fetchone()
+
+                if row is None:
+                    conn.execute("INSERT INTO repos (name, first_seen, last_seen) VALUES (?, ?, ?)",
+                                 (name, seen_at, seen_at))
+                    new.append(name)
+                elif row["removed_at"] is not None:
+                    # 删除后重新出现的代码仓按新增处理
+                    conn.execute("UPDATE repos SET first_seen = ?, removed_at = NULL WHERE name = ?",
+                                 (seen_at, name))
+                    new.append(name)
+
+                conn.execute("UPDATE repos SET repo_id = COALESCE(?, repo_id), last_seen = ?, "
+                             "pushed_at = COALESCE(?, pushed_at), default_branch = COALESCE(?, default_branch), "
+                             "size = COALESCE(?, size) WHERE name = ?",
+                             (repo_id, seen_at, info.get("pushed_at"), info.get("default_branch"),
+                              info.get("size"), name))
+
+            if not partial:
+                for row in conn.execute("SELECT name FROM repos WHERE removed_at IS NULL").fetchall():
+                    if row["name"] not in repos:
+                        removed.append(row["name"])
+            conn.executemany("UPDATE repos SET removed_at = ? WHERE name = ?", [(seen_at, x) for x in removed])
+
+        logging.info(f"inventory updated, new: {len(new)}, removed: {len(removed)}, renamed: {len(renamed)}")
+        return dict(new=new, removed=removed, renamed=renamed)
+
+    def sync_state(self) -> dict:
+        """
+        获取各代码仓最近一次成功同步时的推送时间
+        :return: 代码仓名称 -> {pushed_at, synced_at}
+        """
+        with self.connect() as conn:
+            rows = conn.execute("SELECT name, synced_pushed_at, synced_at FROM repos "
+                                "WHERE synced_pushed_at IS NOT NULL").fetchall()
+        return {x["name"]: dict(pushed_at=x["synced_pushed_at"], synced_at=x["synced_at"]) for x in rows}
+
+    def record_sync(self, results: list, repos: dict):
+        """
+        记录同步结果, 只有同步成功的代码仓更新推送时间
+        :param results: 各代码仓同步结果
+        :param repos: 代码仓名称 -> 代码仓信息
+        """
+        synced_at = now_str()
+        with self.connect() as conn:
+            for res in results:
+                if res["status"] == "success":
+                    conn.execute("UPDATE repos SET synced_pushed_at = ?, synced_at = ?, sync_status = ?, "
+                                 "sync_error = '' WHERE name = ?",
+                                 (repos[res["repo"]].get("pushed_at"), synced_at, res["status"], res["repo"]))
+                elif res["status"] == "failed":
+                    conn.execute("UPDATE repos SET sync_status = ?, sync_error = ? WHERE name = ?",
+                                 (res["status"], res["error"], res["repo"]))
+
+    def query(self, kind: str = "active", since: str = "") -> list:
+        """
+        查询代码仓
+        :param kind: active: 现存的代码仓, new: 新增, removed: 删除, renamed: 重命名, failed: 最近同步失败
+        :param since: 起始时间, 如 2024-01-01 或 2024-01-01T08:00:00
+        :return:
+        """
+        sql = {
+            "active": "SELECT * FROM repos WHERE removed_at IS NULL AND first_seen >= ? ORDER BY name",
+            "new": "SELECT * FROM repos WHERE first_seen >= ? AND removed_at IS NULL ORDER BY first_seen",
+            "removed": "SELECT * FROM repos WHERE removed_at >= ? ORDER BY removed_at",
+            "renamed": "SELECT * FROM repos WHERE renamed_at >= ? ORDER BY renamed_at",
+            "failed": "SELECT * FROM repos WHERE sync_status = 'failed' AND removed_at IS NULL "
+                      "AND COALESCE(synced_at, '') >= ? ORDER BY name",
+        }[kind]
+        with self.connect() as conn:
+            return [dict(x) for x in conn.execute(sql, (since,)).fetchall()]
+
+
+def init_args():
+    parser = argparse.ArgumentParser(description="query repo inventory")
+    parser.add_argument('--db', help='inventory database path, eg: data/ascend_inventory.db', required=True, type=str)
+    parser.add_argument('--kind', help='query kind', default="active",
+                        choices=["active", "new", "removed", "renamed", "failed"])
+    parser.add_argument('--since', help='start time, eg: 2024-01-01', default="", type=str)
+    parser.add_argument('--json', help='output full records as json lines', action='store_true')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = init_args()
+    if not os.path.exists(args.db):
+        raise FileNotFoundError(f"inventory {args.db} not exists")
+
+    for record in RepoInventory(args.db).query(args.kind, args.since):
+        if args.json:
+            print(json.dumps(record, ensure_ascii=False))
+        elif args.kind == "renamed":
+            print(f"{record['prev_name']} -> {record['name']}")
+        else:
+            print(record["name"])
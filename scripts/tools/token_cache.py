@@ -0,0 +1,58 @@
+#! -*- coding: utf-8 -*-
+
+import time
+import hashlib
+import logging
+
+from tools.utils import file_lock, dump_json, load_json
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
+
+
+class TokenCache:
+
+    def __init__(self,
+                 path: str,
+                 margin: float = 600
+                 ):
+        """
+        本地token缓存, 读写时加文件锁, 文件权限仅限当前用户
+        :param path: 缓存文件路径
+        :param margin: 提前失效的时间(秒)
+        """
+        self.path = path
+        self.margin = margin
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        根据账号、作用域等信息生成缓存key
+        :param parts:
+        :return:
+        """
+        return hashlib.sha256("/".join(str(x) for x in parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        获取未过期的token
+        :param key: 缓存key
+        :return: token, 不存在或即将过期时返回None
+        """
+        with file_lock(f"{self.path}.lock"):
+            entry = load_json(self.path).get(key)
+        if entry and entry["expires_at"] - self.margin > time.time():
+            return entry["token"]
+        return None
+
+    def set(self, key: str, token: str, expires_at: float):
+        """
+        写入token, 同时清理已过期的缓存
+        :param key: 缓存key
+        :param token:
+        :param expires_at: 过期时间戳
+        """
+        with file_lock(f"{self.path}.lock"):
+            now = time.time()
+            data = {k: v for k, v in load_json(self.path).items() if v["expires_at"] > now}
+            data[key] = dict(token=token, expires_at=expires_at)
+            dump_json(self.path, data, mode=0o600)
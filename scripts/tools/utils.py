@@ -1,8 +1,14 @@
 #! -*- coding: utf-8 -*-
 
+import os
+import json
 import time
+import tempfile
+import fcntl
+import hashlib
 import functools
 import logging
+from contextlib import contextmanager
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s  %(levelname)s: %(message)s")
 Retry_times = 3
@@ -32,3 +38,67 @@ def retry_decorator(func):
         return res
 
     return wrapper
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    进程间文件锁
+    :param path: 锁文件路径
+    """
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    计算文件内容的sha256
+    :param path: 文件路径
+    :param chunk_size: 分块读取大小
+    :return:
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def dump_json(path: str, data, mode: int = 0o644):
+    """
+    原子写入json文件
+    :param path: 文件路径
+    :param data:
+    :param mode: 文件权限
+    """
+    dir_path = os.path.dirname(path) or "."
+    os.makedirs(dir_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def load_json(path: str, default=None):
+    """
+    读取json文件, 不存在或已损坏时返回默认值
+    :param path: 文件路径
+    :param default: 默认值
+    :return:
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {} if default is None else default